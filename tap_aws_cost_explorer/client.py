@@ -1,14 +1,29 @@
 """Custom client handling, including AWSCostExplorerStream base class."""
 
+import copy
+import functools
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
 import boto3
 
 from singer_sdk.streams.core import Stream
 from singer_sdk.tap_base import Tap
+from singer_sdk import typing as th
 import singer
 from datetime import datetime, timedelta
 import singer
 from singer import utils
 
+from tap_aws_cost_explorer.coalescing import RequestCoalescer
+from tap_aws_cost_explorer.profiling import StreamProfiler
+from tap_aws_cost_explorer.shards import (
+    get_work_unit,
+    is_assigned,
+    split_by_month,
+)
+
 LOGGER = singer.get_logger()
 
 
@@ -25,6 +40,9 @@ REQUIRED_CONFIG_KEYS = [
 class AWSCostExplorerStream(Stream):
     """Stream class for AWSCostExplorer streams."""
 
+    # Columns identifying the group of a record, besides its time period.
+    group_keys: List[str] = []
+
     def __init__(self, tap: Tap):
         super().__init__(tap)
         self.conn = boto3.client(
@@ -33,7 +51,234 @@ class AWSCostExplorerStream(Stream):
             aws_secret_access_key=self.config.get("secret_key"),
             aws_session_token=self.config.get("session_token"),
         )
+        self.coalescer: RequestCoalescer = tap.request_coalescer
+        self.stop_event: threading.Event = tap.stop_event
         self.state = self.get_state()
+        self.profiler: Optional[StreamProfiler] = None
+
+        self.shard_index, self.shard_count = tap.shard
+
+        # Poll mode: where the next poll starts and what was already emitted.
+        self._poll_start: Optional[str] = None
+        self._next_poll_start: Optional[str] = None
+        self._emitted: Dict[Tuple, Tuple] = {}
+        self._records_changed = False
+
+        # Whether a sync of this stream ever read its whole window, and
+        # whether the current one stopped before sending all its requests.
+        self._synced = False
+        self._interrupted = False
+
+        # _sync_with_tags adds the tag columns to the schema in place, so
+        # work on a copy rather than the class-level dict.
+        self.schema = copy.deepcopy(self.schema)
+        if self.config.get("wide_records"):
+            self.schema = self._get_wide_schema()
+            self.primary_keys = self._get_wide_primary_keys()
+
+    def sync(self, context: Optional[dict] = None) -> None:
+        """Sync this stream, under the CPU and memory profilers if enabled."""
+        self.profiler = None
+        if self.stop_event.is_set():
+            LOGGER.info("Skipping %s, the tap is stopping", self.name)
+            return
+
+        self._records_changed = False
+        self._next_poll_start = None
+        self._interrupted = False
+
+        if not self.config.get("profile"):
+            super().sync(context)
+        else:
+            self.profiler = StreamProfiler(
+                self.name, self.config.get("profile_dir") or "profiles"
+            )
+            with self.profiler:
+                super().sync(context)
+
+        if self._interrupted:
+            return
+        self._synced = True
+
+        if self.config.get("poll_interval") and self._next_poll_start:
+            self._poll_start = self._next_poll_start
+            self._prune_emitted()
+
+    def _get_cost_and_usage(self, **request) -> List[dict]:
+        """Return the ResultsByTime of every page of a cost and usage request.
+
+        Identical requests made by any stream of the run are only sent to
+        Cost Explorer once. When ``shard_count`` is above one the time period
+        is split by calendar month and only the (request, month) work units
+        assigned to this shard are requested.
+        """
+        time_period = request["TimePeriod"]
+        if time_period["Start"] >= time_period["End"]:
+            LOGGER.info(
+                'Nothing to request for %s: %s', self.name, time_period
+            )
+            return []
+
+        if self.shard_count > 1:
+            requests = [
+                {**request, "TimePeriod": {"Start": start, "End": end}}
+                for start, end in split_by_month(
+                    time_period["Start"], time_period["End"]
+                )
+            ]
+            requests = [
+                shard_request for shard_request in requests
+                if is_assigned(
+                    get_work_unit(
+                        request, shard_request["TimePeriod"]["Start"]
+                    ),
+                    self.shard_index,
+                    self.shard_count,
+                )
+            ]
+        else:
+            requests = [request]
+
+        results = []
+        for shard_request in requests:
+            if self.stop_event.is_set():
+                LOGGER.info("Skipping remaining requests of %s", self.name)
+                self._interrupted = True
+                break
+            results.extend(self.coalescer.get(
+                shard_request,
+                functools.partial(self._fetch_cost_and_usage, shard_request),
+            ))
+        if self.config.get("poll_interval"):
+            self._track_poll_start(results)
+        return results
+
+    def _track_poll_start(self, results: List[dict]) -> None:
+        """Move the next poll start to the first period still estimated.
+
+        When every period is final the next poll starts where this one
+        ended, so only new periods are requested.
+        """
+        estimated = [
+            row["TimePeriod"]["Start"] for row in results if row.get("Estimated")
+        ]
+        if estimated:
+            candidate = min(estimated)
+        elif results:
+            candidate = max(row["TimePeriod"]["End"] for row in results)
+        else:
+            return
+
+        if self._next_poll_start is None or candidate < self._next_poll_start:
+            self._next_poll_start = candidate
+
+    def _fetch_cost_and_usage(self, request: dict) -> List[dict]:
+        results = []
+        count = 0
+        next_page = None
+        while True:
+            if next_page:
+                response = self.conn.get_cost_and_usage(
+                    **request, NextPageToken=next_page
+                )
+            else:
+                response = self.conn.get_cost_and_usage(**request)
+
+            results.extend(response['ResultsByTime'])
+            count += 1
+            LOGGER.info(f'Request: {count}')
+
+            next_page = response.get("NextPageToken")
+            if not next_page:
+                return results
+
+    @staticmethod
+    def _get_metric_column(metric_name):
+        """Return the snake_case column prefix for a Cost Explorer metric."""
+        return re.sub(r"(?<!^)(?=[A-Z])", "_", metric_name).lower()
+
+    def _has_tag_columns(self):
+        return bool(self.group_keys and self.config.get("tag_keys"))
+
+    def _get_wide_primary_keys(self):
+        """Return the primary keys of one record per (period, group)."""
+        primary_keys = ["time_period_start", *self.group_keys]
+        if self._has_tag_columns():
+            primary_keys.extend(["tag_key", "tag_value"])
+        return primary_keys
+
+    def _get_wide_schema(self):
+        """Return the stream schema with one amount/unit column per metric.
+
+        Grouped streams also get their tag columns when ``tag_keys`` is set,
+        as those are part of the primary key in this layout.
+        """
+        schema = copy.deepcopy(self.schema)
+        for key in ("metric_name", "amount", "amount_unit"):
+            schema["properties"].pop(key, None)
+
+        properties = []
+        if self._has_tag_columns():
+            properties.extend([
+                th.Property("tag_key", th.StringType),
+                th.Property("tag_value", th.StringType),
+            ])
+        for metric_name in self.config.get("metrics"):
+            column = self._get_metric_column(metric_name)
+            properties.extend([
+                th.Property(f"{column}_amount", th.StringType),
+                th.Property(f"{column}_amount_unit", th.StringType),
+            ])
+        schema["properties"].update(
+            th.PropertiesList(*properties).to_dict()["properties"]
+        )
+        return schema
+
+    def _build_records(self, record, metrics):
+        """Return the records for one (period, group) and its metrics.
+
+        In the default layout one record is returned per metric. With
+        ``wide_records`` enabled a single record is returned carrying every
+        metric as its own amount and unit columns.
+        """
+        if self.config.get("wide_records"):
+            wide_record = dict(record)
+            for metric_name, value in metrics.items():
+                column = self._get_metric_column(metric_name)
+                wide_record[f"{column}_amount"] = value.get("Amount")
+                wide_record[f"{column}_amount_unit"] = value.get("Unit")
+            records = [wide_record]
+        else:
+            records = [
+                {
+                    **record,
+                    "metric_name": metric_name,
+                    "amount": value.get("Amount"),
+                    "amount_unit": value.get("Unit"),
+                }
+                for metric_name, value in metrics.items()
+            ]
+
+        if self.config.get("poll_interval"):
+            records = [record for record in records if self._has_changed(record)]
+        return records
+
+    def _has_changed(self, record):
+        """Return whether ``record`` differs from what a previous poll emitted."""
+        identity = tuple(sorted(
+            (key, value) for key, value in record.items()
+            if not key.endswith(("amount", "amount_unit"))
+        ))
+        amounts = tuple(sorted(
+            (key, value) for key, value in record.items()
+            if key.endswith(("amount", "amount_unit"))
+        ))
+        if self._emitted.get(identity) == amounts:
+            return False
+
+        self._emitted[identity] = amounts
+        self._records_changed = True
+        return True
 
     def get_bookmark(self):
         if (self.state is None) or ("bookmarks" not in self.state):
@@ -45,7 +290,36 @@ class AWSCostExplorerStream(Stream):
             LOGGER.info(stream_bookmark["last_value"])
             return stream_bookmark["last_value"]
 
-    def _write_state_message(self):
+    def _prune_emitted(self):
+        """Forget records of periods before the poll start, as they are final."""
+        self._emitted = {
+            identity: amounts for identity, amounts in self._emitted.items()
+            if dict(identity)["time_period_start"] >= self._poll_start
+        }
+
+    def _get_start_date_str(self, start_date):
+        """Return the start of the window to query, as ``%Y-%m-%d``.
+
+        In poll mode every poll after the first only re-reads the periods
+        Cost Explorer still reported as estimated, plus any new ones.
+        """
+        if self._poll_start:
+            return self._poll_start
+        if self.get_bookmark():
+            return self.get_bookmark()
+        return start_date.strftime("%Y-%m-%d")
+
+    def _write_state_message(self, force=False):
+        # Never move the bookmark past data a stopped sync did not read.
+        if self._interrupted or (force and not self._synced):
+            return
+
+        if (
+            self.config.get("poll_interval")
+            and not self._records_changed
+            and not force
+        ):
+            return
 
         if "bookmarks" not in self.state:
             self.state["bookmarks"] = {}
@@ -57,6 +331,11 @@ class AWSCostExplorerStream(Stream):
         value_dict = {"last_value": value}
 
         self.state["bookmarks"][self.tap_stream_id] = value_dict
+        if self.shard_count > 1:
+            self.state["shard"] = {
+                "index": self.shard_index,
+                "count": self.shard_count,
+            }
         
         singer.write_state(self.state)
 
@@ -0,0 +1,130 @@
+"""Single-flight coalescing of identical Cost Explorer requests within a run."""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+def get_request_key(request: Dict[str, Any]) -> str:
+    """Return the normalized key of a ``get_cost_and_usage`` request."""
+    return json.dumps(request, sort_keys=True, separators=(",", ":"))
+
+
+def estimate_size(results: List[dict]) -> int:
+    """Return the approximate serialized JSON size of ``ResultsByTime`` rows.
+
+    Counts rows, groups and metrics rather than serializing them, which would
+    cost as much as the serialization this cache exists to save.
+    """
+    size = 0
+    for row in results:
+        size += 100 + 60 * len(row.get("Total") or {})
+        for group in row.get("Groups") or ():
+            size += 20 + sum(len(key) + 4 for key in group.get("Keys", ()))
+            size += 60 * len(group.get("Metrics") or {})
+    return size
+
+
+class _Entry:
+    """The shared result of one in-flight or completed request."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[List[dict]] = None
+        self.error: Optional[BaseException] = None
+        self.size = 0
+
+
+class RequestCoalescer:
+    """Issue each distinct Cost Explorer request only once per run.
+
+    Requests are keyed on their normalized JSON form, so two streams (or
+    threads) asking for the same time period, granularity, metrics, filter
+    and grouping share a single paginated fetch. Callers arriving while the
+    fetch is in flight wait for it instead of issuing their own.
+
+    Completed results are retained up to ``max_bytes`` of estimated
+    serialized JSON size, the least recently completed or used being dropped
+    first. A result larger than the whole budget is only shared with the
+    callers already waiting for it, and does not evict anything else. The shared results must be treated as read-only
+    by consumers.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def get(
+        self,
+        request: Dict[str, Any],
+        fetch: Callable[[], List[dict]],
+    ) -> List[dict]:
+        """Return the result of ``request``, calling ``fetch`` only if needed."""
+        key = get_request_key(request)
+        with self._lock:
+            entry = self._entries.get(key)
+            is_owner = entry is None
+            if is_owner:
+                entry = self._entries[key] = _Entry()
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if not is_owner:
+            LOGGER.info("Reusing coalesced Cost Explorer request")
+            entry.done.wait()
+            if entry.error is not None:
+                raise entry.error
+            return entry.result
+
+        try:
+            entry.result = fetch()
+        except BaseException as exc:
+            entry.error = exc
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+        else:
+            entry.size = estimate_size(entry.result)
+        finally:
+            entry.done.set()
+
+        self._retain(key, entry)
+        return entry.result
+
+    def clear(self):
+        """Forget every completed result, e.g. before a new poll."""
+        with self._lock:
+            for key in [
+                key for key, entry in self._entries.items() if entry.done.is_set()
+            ]:
+                del self._entries[key]
+
+    def _retain(self, key: str, entry: _Entry):
+        """Keep a completed entry, evicting the least recently used ones."""
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return
+            if entry.size > self.max_bytes:
+                del self._entries[key]
+                return
+
+            self._entries.move_to_end(key)
+            completed = [
+                (other_key, other) for other_key, other in self._entries.items()
+                if other.done.is_set()
+            ]
+            retained = sum(other.size for _, other in completed)
+            for other_key, other in completed:
+                if retained <= self.max_bytes:
+                    break
+                del self._entries[other_key]
+                retained -= other.size
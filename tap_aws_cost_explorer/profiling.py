@@ -0,0 +1,146 @@
+"""CPU and memory profiling hooks for tap-aws-cost-explorer stream syncs."""
+
+import cProfile
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+class StreamProfiler:
+    """Profile the sync of one stream with cProfile, a stack sampler and tracemalloc.
+
+    On exit two files are written to ``output_dir``:
+
+    - ``<stream>.pstats``: cProfile statistics, readable with ``pstats`` or
+      ``snakeviz``.
+    - ``<stream>.folded``: sampled call stacks in the collapsed format used by
+      ``flamegraph.pl`` and ``speedscope``.
+
+    Peak traced memory and the top allocation sites are kept on the instance
+    so they can be reported once the whole run is over. The allocation sites
+    come from a snapshot the sampler takes whenever traced memory grows by
+    more than ``PEAK_SNAPSHOT_GROWTH`` over the previous snapshot, so they
+    describe what was alive around the peak rather than at the end.
+    """
+
+    PEAK_SNAPSHOT_GROWTH = 0.25
+
+    def __init__(
+        self,
+        stream_name: str,
+        output_dir: str,
+        sample_interval: float = 0.005,
+        top_allocations: int = 10,
+    ):
+        self.stream_name = stream_name
+        self.output_dir = Path(output_dir)
+        self.sample_interval = sample_interval
+        self.top_allocations = top_allocations
+
+        self.peak_memory: Optional[int] = None
+        self.allocation_sites: List[tracemalloc.Statistic] = []
+
+        self._profiler = cProfile.Profile()
+        self._stacks: Counter = Counter()
+        self._stop_sampling = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._thread_id: Optional[int] = None
+        self._started_tracing = False
+        self._peak_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak_snapshot_size = 0
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(
+            target=self._sample_stacks,
+            name=f"profile-{self.stream_name}",
+            daemon=True,
+        )
+        # Leave tracing started outside the profiler (PYTHONTRACEMALLOC) on.
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        self._sampler.start()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.disable()
+        self._stop_sampling.set()
+        self._sampler.join()
+
+        self._snapshot_if_peak()
+        _, self.peak_memory = tracemalloc.get_traced_memory()
+        if self._started_tracing:
+            tracemalloc.stop()
+
+        snapshot = self._peak_snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        self.allocation_sites = snapshot.statistics("lineno")[
+            :self.top_allocations
+        ]
+
+        self._write_profiles()
+
+    def _snapshot_if_peak(self):
+        """Snapshot the traced allocations if memory reached a new high."""
+        current, _ = tracemalloc.get_traced_memory()
+        threshold = self._peak_snapshot_size * (1 + self.PEAK_SNAPSHOT_GROWTH)
+        if self._peak_snapshot is None or current > threshold:
+            self._peak_snapshot = tracemalloc.take_snapshot()
+            self._peak_snapshot_size = current
+
+    def _sample_stacks(self):
+        """Record the syncing thread's stack and peak memory periodically."""
+        while not self._stop_sampling.wait(self.sample_interval):
+            self._snapshot_if_peak()
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def _write_profiles(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        pstats_path = self.output_dir / f"{self.stream_name}.pstats"
+        folded_path = self.output_dir / f"{self.stream_name}.folded"
+
+        self._profiler.dump_stats(str(pstats_path))
+        with open(folded_path, "w") as folded_file:
+            for stack, count in self._stacks.most_common():
+                folded_file.write(f"{stack} {count}\n")
+
+        LOGGER.info(
+            "Wrote profiles for %s to %s and %s",
+            self.stream_name, pstats_path, folded_path
+        )
+
+    def log_summary(self):
+        """Log peak memory and the top allocation sites of the stream sync."""
+        LOGGER.info(
+            "Profile for %s: peak memory %.1f KiB",
+            self.stream_name, (self.peak_memory or 0) / 1024
+        )
+        for statistic in self.allocation_sites:
+            frame = statistic.traceback[0]
+            LOGGER.info(
+                "  %s:%s: %.1f KiB in %d blocks",
+                frame.filename, frame.lineno, statistic.size / 1024,
+                statistic.count
+            )
@@ -0,0 +1,116 @@
+"""Deterministic work sharding and shard state merging for tap-aws-cost-explorer."""
+
+import argparse
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+from tap_aws_cost_explorer.coalescing import get_request_key
+
+
+def get_work_unit(request: Dict[str, Any], window_start: str) -> Dict[str, Any]:
+    """Return the shardable work unit of ``request`` for one month window.
+
+    The unit names the month rather than the actual window, whose first start
+    is each shard's own bookmark or poll start. Shards starting on different
+    days therefore still agree on which of them owns every month.
+    """
+    return {**request, "TimePeriod": {"Month": window_start[:7]}}
+
+
+def is_assigned(work_unit: Dict[str, Any], shard_index: int, shard_count: int) -> bool:
+    """Return whether ``work_unit`` belongs to the shard ``shard_index``.
+
+    The assignment only depends on the normalized work unit, so every process
+    given the same config agrees on it without coordinating.
+    """
+    key = get_request_key(work_unit)
+    return zlib.crc32(key.encode("utf-8")) % shard_count == shard_index
+
+
+def split_by_month(start: str, end: str) -> List[Tuple[str, str]]:
+    """Split the ``[start, end)`` time period on calendar month boundaries.
+
+    Boundaries keep the format of ``start`` (a date, or an HOURLY timestamp).
+    """
+    suffix = "T00:00:00Z" if len(start) > 10 else ""
+    windows = []
+    window_start = start
+    current = datetime.strptime(start[:10], "%Y-%m-%d").date().replace(day=1)
+    while True:
+        if current.month == 12:
+            current = current.replace(year=current.year + 1, month=1)
+        else:
+            current = current.replace(month=current.month + 1)
+        boundary = current.isoformat() + suffix
+        if boundary >= end:
+            windows.append((window_start, end))
+            return windows
+        windows.append((window_start, boundary))
+        window_start = boundary
+
+
+def merge_shard_states(states: Iterable[dict]) -> dict:
+    """Combine the states written by every shard of a run into one state.
+
+    Every shard of the run must be present and bookmark the same streams.
+    For each stream the earliest bookmark wins, so no shard's remaining work
+    is skipped on the next run.
+    """
+    states = list(states)
+    if not states:
+        raise ValueError("No shard states to merge.")
+
+    shard_counts = {state.get("shard", {}).get("count") for state in states}
+    if len(shard_counts) != 1 or None in shard_counts:
+        raise ValueError(f"Shard states disagree on shard count: {shard_counts}")
+
+    shard_count = shard_counts.pop()
+    shard_indexes = sorted(state["shard"]["index"] for state in states)
+    if shard_indexes != list(range(shard_count)):
+        raise ValueError(
+            f"Expected states for shards 0..{shard_count - 1}, "
+            f"got {shard_indexes}."
+        )
+
+    # A stream missing from one shard's state may still have unread work
+    # there, so letting another shard's bookmark stand in for it is unsafe.
+    stream_ids = [set(state.get("bookmarks", {})) for state in states]
+    if any(ids != stream_ids[0] for ids in stream_ids):
+        raise ValueError(
+            "Shard states bookmark different streams: "
+            f"{sorted(set().union(*stream_ids) - set.intersection(*stream_ids))} "
+            "missing from some shards."
+        )
+
+    bookmarks: Dict[str, dict] = {}
+    for state in states:
+        for stream_id, bookmark in state.get("bookmarks", {}).items():
+            merged = bookmarks.get(stream_id)
+            if merged is None or (
+                bookmark.get("last_value", "") < merged.get("last_value", "")
+            ):
+                bookmarks[stream_id] = bookmark
+
+    return {"bookmarks": bookmarks}
+
+
+def main():
+    """Merge shard state files given on the command line into one state file."""
+    parser = argparse.ArgumentParser(
+        description="Merge the state files of every tap-aws-cost-explorer shard."
+    )
+    parser.add_argument("states", nargs="+", help="State file of each shard.")
+    parser.add_argument(
+        "-o", "--output", required=True, help="Path of the merged state file."
+    )
+    args = parser.parse_args()
+
+    states = []
+    for path in args.states:
+        with open(path) as state_file:
+            states.append(json.load(state_file))
+
+    with open(args.output, "w") as output_file:
+        json.dump(merge_shard_states(states), output_file, indent=2)
@@ -36,61 +36,39 @@ class CostAndUsageWithResourcesStream(AWSCostExplorerStream):
 
         LOGGER.info('Starting sync for %s', self.name)
         """Return a generator of row-type dictionary objects."""
-        next_page = True
         start_date = self.get_starting_timestamp(context)
         end_date = self._get_end_date()
         data = []
-        count = 0
-        start_date_str = self.get_bookmark(
-        ) if self.get_bookmark() else start_date.strftime("%Y-%m-%d")
+        start_date_str = self._get_start_date_str(start_date)
         
 
         LOGGER.info(f'Start Date: {start_date_str}')
-        response = self.conn.get_cost_and_usage(
+        data.extend(self._get_cost_and_usage(
             TimePeriod={
                 'Start': start_date_str,
                 'End': end_date.strftime("%Y-%m-%d")
             },
             Granularity=self.config.get("granularity"),
             Metrics=self.config.get("metrics"),
-        )
-
-        next_page = response.get("NextPageToken")
-        data.extend(response['ResultsByTime'])
-        count += 1
-        LOGGER.info(f'Request: {count}')
-        while next_page:
-            response = self.conn.get_cost_and_usage(
-                TimePeriod={
-                    'Start': start_date_str,
-                    'End': end_date.strftime("%Y-%m-%d")
-                },
-                Granularity=self.config.get("granularity"),
-                Metrics=self.config.get("metrics"),
-                NextPageToken=next_page
-            )
-            next_page = response.get("NextPageToken")
-            data.extend(response['ResultsByTime'])
-            count += 1
-            LOGGER.info(f'Request: {count}')
+        ))
 
         # LOGGER.info(f'Data: {data}')
 
         for row in data:
-            for k, v in row.get("Total").items():
-                yield {
+            yield from self._build_records(
+                {
                     "time_period_start": row.get("TimePeriod").get("Start"),
                     "time_period_end": row.get("TimePeriod").get("End"),
-                    "metric_name": k,
-                    "amount": v.get("Amount"),
-                    "amount_unit": v.get("Unit")
-                }
+                },
+                row.get("Total"),
+            )
 
 
 class CostsByServicesStream(AWSCostExplorerStream):
     """Define custom stream."""
     name = "costs_by_services"
     primary_keys = ["metric_name", "time_period_start"]
+    group_keys = ["service", "charge_type"]
     replication_key = "time_period_start"
     schema = th.PropertiesList(
             th.Property("time_period_start", th.DateTimeType),
@@ -120,11 +98,9 @@ class CostsByServicesStream(AWSCostExplorerStream):
             new_property = th.Property("tag_value", th.StringType)
             self.schema["properties"]["tag_value"] = new_property.to_dict()
 
-        count = 0
         data = []
 
-        start_date_str = self.get_bookmark(
-        ) if self.get_bookmark() else start_date.strftime("%Y-%m-%d")
+        start_date_str = self._get_start_date_str(start_date)
 
         LOGGER.info(f'Start Date: {start_date_str}')
         tags_keys = self.config.get("tag_keys")
@@ -132,7 +108,7 @@ class CostsByServicesStream(AWSCostExplorerStream):
         for tag in tags_keys:
             for record_type in self.config.get("record_types"):
 
-                response = self.conn.get_cost_and_usage(
+                results = self._get_cost_and_usage(
                     TimePeriod={
                         'Start': start_date_str,
                         'End': end_date.strftime("%Y-%m-%d")
@@ -156,56 +132,13 @@ class CostsByServicesStream(AWSCostExplorerStream):
                         }
                     ]
                 )
-
-                next_page = response.get("NextPageToken")
                 data.append(
                     {
-                        "Results": response['ResultsByTime'], 
+                        "Results": results,
                         "RecordType": record_type
                     }
                 )
 
-                count += 1
-                LOGGER.info(f'Request: {count}')
-
-                while next_page:
-                    response = self.conn.get_cost_and_usage(
-                        TimePeriod={
-                            'Start': start_date_str,
-                            'End': end_date.strftime("%Y-%m-%d")
-                        },
-                        Granularity=self.config.get("granularity"),
-                        Metrics=self.config.get("metrics"),
-                        Filter={
-                            'Dimensions': {
-                                'Key': 'RECORD_TYPE',
-                                'Values': [record_type],
-                            }
-                        },
-                        GroupBy=[
-                            {
-                                'Type': 'DIMENSION',
-                                'Key': 'SERVICE'
-                            },
-                            {
-                                "Type":"TAG",
-                                "Key": tag
-                            }
-                        ],
-                        NextPageToken=next_page
-                    )
-
-                    next_page = response.get("NextPageToken")
-                    data.append(
-                        {
-                            "Results": response['ResultsByTime'], 
-                            "RecordType": record_type
-                        }
-                    )
-
-                    count += 1
-                    LOGGER.info(f'Request: {count}')
-
         return data
 
     def _sync_without_tags(self, start_date, end_date):
@@ -214,15 +147,13 @@ class CostsByServicesStream(AWSCostExplorerStream):
         LOGGER.info('Starting _sync_without_tags for %s', self.name)
 
         data = []
-        count = 0
 
-        start_date_str = self.get_bookmark(
-        ) if self.get_bookmark() else start_date.strftime("%Y-%m-%d")
+        start_date_str = self._get_start_date_str(start_date)
 
         LOGGER.info(f'Start Date: {start_date_str}')
 
         for record_type in self.config.get("record_types"):
-            response = self.conn.get_cost_and_usage(
+            results = self._get_cost_and_usage(
                 TimePeriod={
                     'Start': start_date_str,
                     'End': end_date.strftime("%Y-%m-%d")
@@ -242,50 +173,13 @@ class CostsByServicesStream(AWSCostExplorerStream):
                     }
                 ]
             )
-            next_page = response.get("NextPageToken")
-
             data.append(
-                    {
-                        "Results": response['ResultsByTime'], 
-                        "RecordType": record_type
-                    }
+                {
+                    "Results": results,
+                    "RecordType": record_type
+                }
             )
 
-            count += 1
-            LOGGER.info(f'Request: {count}')
-
-            while next_page:
-                response = self.conn.get_cost_and_usage(
-                    TimePeriod={
-                        'Start': start_date_str,
-                        'End': end_date.strftime("%Y-%m-%d")
-                    },
-                    Granularity=self.config.get("granularity"),
-                    Metrics=self.config.get("metrics"),
-                    Filter={
-                        'Dimensions': {
-                            'Key': 'RECORD_TYPE',
-                            'Values': [record_type],
-                        }
-                    },
-                    GroupBy=[
-                        {
-                            'Type': 'DIMENSION',
-                            'Key': 'SERVICE'
-                        }
-                    ],
-                    NextPageToken=next_page
-                )
-
-                next_page = response.get("NextPageToken")
-                data.append(
-                    {
-                        "Results": response['ResultsByTime'], 
-                        "RecordType": record_type
-                    }
-                )
-                count += 1
-
         return data
     
     def get_records(self, context: Optional[dict]) -> Iterable[dict]:
@@ -301,35 +195,23 @@ class CostsByServicesStream(AWSCostExplorerStream):
         for d in data:
             for row in d['Results']:
                 for k in row.get("Groups"):
-                    for i, j in k.get("Metrics").items():
-                        if self.config.get("tag_keys", None):
-                            yield {
-                                "time_period_start": row.get("TimePeriod").get("Start"),
-                                "time_period_end": row.get("TimePeriod").get("End"),
-                                "metric_name": i,
-                                "amount": j.get("Amount"),
-                                "amount_unit": j.get("Unit"),
-                                "service": k.get('Keys')[0],
-                                "charge_type": d.get('RecordType'),
-                                "tag_key": k.get('Keys')[1].split("$")[0],
-                                "tag_value": k.get('Keys')[1].split("$")[1],
-                            }
-                        else:
-                            yield {
-                                "time_period_start": row.get("TimePeriod").get("Start"),
-                                "time_period_end": row.get("TimePeriod").get("End"),
-                                "metric_name": i,
-                                "amount": j.get("Amount"),
-                                "amount_unit": j.get("Unit"),
-                                "service": k.get('Keys')[0],
-                                "charge_type": d.get('RecordType')
-                            }
+                    record = {
+                        "time_period_start": row.get("TimePeriod").get("Start"),
+                        "time_period_end": row.get("TimePeriod").get("End"),
+                        "service": k.get('Keys')[0],
+                        "charge_type": d.get('RecordType'),
+                    }
+                    if self.config.get("tag_keys", None):
+                        record["tag_key"] = k.get('Keys')[1].split("$")[0]
+                        record["tag_value"] = k.get('Keys')[1].split("$")[1]
+                    yield from self._build_records(record, k.get("Metrics"))
 
 
 class CostsByUsageTypeStream(AWSCostExplorerStream):
     """Define custom stream."""
     name = "costs_by_usage_type"
     primary_keys = ["metric_name", "time_period_start"]
+    group_keys = ["usage_type", "charge_type"]
     replication_key = "time_period_start"
 
     schema = th.PropertiesList(
@@ -361,18 +243,16 @@ class CostsByUsageTypeStream(AWSCostExplorerStream):
             new_property = th.Property("tag_value", th.StringType)
             self.schema["properties"]["tag_value"] = new_property.to_dict()
 
-        count = 0
         data = []
 
-        start_date_str = self.get_bookmark(
-        ) if self.get_bookmark() else start_date.strftime("%Y-%m-%d")
+        start_date_str = self._get_start_date_str(start_date)
 
         LOGGER.info(f'Start Date: {start_date_str}')
         tags_keys = self.config.get("tag_keys")
 
         for tag in tags_keys:
             for record_type in self.config.get("record_types"):
-                response = self.conn.get_cost_and_usage(
+                results = self._get_cost_and_usage(
                     TimePeriod={
                         'Start': start_date_str,
                         'End': end_date.strftime("%Y-%m-%d")
@@ -396,82 +276,39 @@ class CostsByUsageTypeStream(AWSCostExplorerStream):
                         }
                     ]
                 )
-
-                next_page = response.get("NextPageToken")
                 data.append(
                     {
-                        "Results": response['ResultsByTime'], 
+                        "Results": results,
                         "RecordType": record_type
                     }
                 )
 
-                count += 1
-                LOGGER.info(f'Request: {count}')
-
-                while next_page:
-                    response = self.conn.get_cost_and_usage(
-                        TimePeriod={
-                            'Start': start_date_str,
-                            'End': end_date.strftime("%Y-%m-%d")
-                        },
-                        Granularity=self.config.get("granularity"),
-                        Metrics=self.config.get("metrics"),
-                        Filter={
-                            'Dimensions': {
-                                'Key': 'RECORD_TYPE',
-                                'Values': [record_type],
-                            }
-                        },
-                        GroupBy=[
-                            {
-                                'Type': 'DIMENSION',
-                                'Key': 'SERVICE'
-                            },
-                            {
-                                "Type":"TAG",
-                                "Key": tag
-                            }
-                        ],
-                        NextPageToken=next_page
-                    )
-
-                    next_page = response.get("NextPageToken")
-                    data.append(
-                        {
-                            "Results": response['ResultsByTime'], 
-                            "RecordType": record_type
-                        }
-                    )
-
-                    count += 1
-                    LOGGER.info(f'Request: {count}')
-
         return data
 
     def _sync_without_tags(self, start_date, end_date):
         """Return a generator of row-type dictionary objects."""
         LOGGER.info('Starting _sync_without_tags for %s', self.name)
 
-        self.schema = th.PropertiesList(
-            th.Property("time_period_start", th.DateTimeType),
-            th.Property("time_period_end", th.DateTimeType),
-            th.Property("metric_name", th.StringType),
-            th.Property("amount", th.StringType),
-            th.Property("amount_unit", th.StringType),
-            th.Property("usage_type", th.StringType),
-            th.Property("charge_type", th.StringType),
-        ).to_dict()
+        # The wide layout's schema is fixed once in __init__.
+        if not self.config.get("wide_records"):
+            self.schema = th.PropertiesList(
+                th.Property("time_period_start", th.DateTimeType),
+                th.Property("time_period_end", th.DateTimeType),
+                th.Property("metric_name", th.StringType),
+                th.Property("amount", th.StringType),
+                th.Property("amount_unit", th.StringType),
+                th.Property("usage_type", th.StringType),
+                th.Property("charge_type", th.StringType),
+            ).to_dict()
 
         data = []
-        count = 0
 
-        start_date_str = self.get_bookmark(
-        ) if self.get_bookmark() else start_date.strftime("%Y-%m-%d")
+        start_date_str = self._get_start_date_str(start_date)
 
         LOGGER.info(f'Start Date: {start_date_str}')
 
         for record_type in self.config.get("record_types"):
-            response = self.conn.get_cost_and_usage(
+            results = self._get_cost_and_usage(
                 TimePeriod={
                     'Start': start_date_str,
                     'End': end_date.strftime("%Y-%m-%d")
@@ -491,50 +328,13 @@ class CostsByUsageTypeStream(AWSCostExplorerStream):
                     }
                 ]
             )
-            next_page = response.get("NextPageToken")
-
             data.append(
-                    {
-                        "Results": response['ResultsByTime'], 
-                        "RecordType": record_type
-                    }
+                {
+                    "Results": results,
+                    "RecordType": record_type
+                }
             )
 
-            count += 1
-            LOGGER.info(f'Request: {count}')
-
-            while next_page:
-                response = self.conn.get_cost_and_usage(
-                    TimePeriod={
-                        'Start': start_date_str,
-                        'End': end_date.strftime("%Y-%m-%d")
-                    },
-                    Granularity=self.config.get("granularity"),
-                    Metrics=self.config.get("metrics"),
-                    Filter={
-                        'Dimensions': {
-                            'Key': 'RECORD_TYPE',
-                            'Values': [record_type],
-                        }
-                    },
-                    GroupBy=[
-                        {
-                            'Type': 'DIMENSION',
-                            'Key': 'USAGE_TYPE'
-                        }
-                    ],
-                    NextPageToken=next_page
-                )
-
-                next_page = response.get("NextPageToken")
-                data.append(
-                    {
-                        "Results": response['ResultsByTime'], 
-                        "RecordType": record_type
-                    }
-                )
-                count += 1
-
         return data
     
     def get_records(self, context: Optional[dict]) -> Iterable[dict]:
@@ -550,26 +350,13 @@ class CostsByUsageTypeStream(AWSCostExplorerStream):
         for d in data:
             for row in d['Results']:
                 for k in row.get("Groups"):
-                    for i, j in k.get("Metrics").items():
-                        if self.config.get("tag_keys", None):
-                            yield {
-                                "time_period_start": row.get("TimePeriod").get("Start"),
-                                "time_period_end": row.get("TimePeriod").get("End"),
-                                "metric_name": i,
-                                "amount": j.get("Amount"),
-                                "amount_unit": j.get("Unit"),
-                                "usage_type": k.get('Keys')[0],
-                                "charge_type": d.get('RecordType'),
-                                "tag_key": k.get('Keys')[1].split("$")[0],
-                                "tag_value": k.get('Keys')[1].split("$")[1],
-                            }
-                        else:
-                            yield {
-                                "time_period_start": row.get("TimePeriod").get("Start"),
-                                "time_period_end": row.get("TimePeriod").get("End"),
-                                "metric_name": i,
-                                "amount": j.get("Amount"),
-                                "amount_unit": j.get("Unit"),
-                                "usage_type": k.get('Keys')[0],
-                                "charge_type": d.get('RecordType')
-                            }
\ No newline at end of file
+                    record = {
+                        "time_period_start": row.get("TimePeriod").get("Start"),
+                        "time_period_end": row.get("TimePeriod").get("End"),
+                        "usage_type": k.get('Keys')[0],
+                        "charge_type": d.get('RecordType'),
+                    }
+                    if self.config.get("tag_keys", None):
+                        record["tag_key"] = k.get('Keys')[1].split("$")[0]
+                        record["tag_value"] = k.get('Keys')[1].split("$")[1]
+                    yield from self._build_records(record, k.get("Metrics"))
\ No newline at end of file
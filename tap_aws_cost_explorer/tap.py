@@ -1,15 +1,22 @@
 """AWSCostExplorer tap class."""
 
-from typing import List
+import signal
+import threading
+from typing import List, Tuple
 
 from singer_sdk import Tap, Stream
 from singer_sdk import typing as th  # JSON schema typing helpers
+import singer
 
+from tap_aws_cost_explorer.coalescing import RequestCoalescer
 from tap_aws_cost_explorer.streams import (
     CostAndUsageWithResourcesStream,
     CostsByServicesStream,
     CostsByUsageTypeStream
 )
+
+LOGGER = singer.get_logger()
+
 STREAM_TYPES = [
     CostAndUsageWithResourcesStream,
     CostsByServicesStream,
@@ -81,8 +88,141 @@ class TapAWSCostExplorer(Tap):
             required=False,
             description="Which tag are returned in the query."
         ),
+        th.Property(
+            "wide_records",
+            th.BooleanType,
+            required=False,
+            description="Emit one record per time period and group with an \
+                        amount and unit column for each configured metric, \
+                        instead of one record per metric."
+        ),
+        th.Property(
+            "profile",
+            th.BooleanType,
+            required=False,
+            description="Profile CPU and memory usage of each stream sync \
+                        and report peak memory at the end of the run."
+        ),
+        th.Property(
+            "profile_dir",
+            th.StringType,
+            required=False,
+            description="Directory the per-stream pstats and folded stack \
+                        profiles are written to. Defaults to ./profiles."
+        ),
+        th.Property(
+            "request_cache_max_mb",
+            th.IntegerType,
+            required=False,
+            description="Approximate size, in MB of serialized JSON, of the \
+                        completed Cost Explorer results kept for reuse by \
+                        other streams of the same run. Defaults to 64."
+        ),
+        th.Property(
+            "poll_interval",
+            th.IntegerType,
+            required=False,
+            description="Keep the tap running and re-query the periods \
+                        still estimated by Cost Explorer every given number \
+                        of seconds, emitting only changed records."
+        ),
+        th.Property(
+            "shard_index",
+            th.IntegerType,
+            required=False,
+            description="Index, starting at 0, of the shard of the work \
+                        this process syncs. Defaults to 0."
+        ),
+        th.Property(
+            "shard_count",
+            th.IntegerType,
+            required=False,
+            description="Number of processes the work is split across. \
+                        Defaults to 1."
+        ),
     ).to_dict()
 
+    @property
+    def request_coalescer(self) -> RequestCoalescer:
+        """Return the request coalescer shared by every stream of this run."""
+        if getattr(self, "_request_coalescer", None) is None:
+            max_mb = self.config.get("request_cache_max_mb")
+            self._request_coalescer = RequestCoalescer(
+                (64 if max_mb is None else max_mb) * 1024 * 1024
+            )
+        return self._request_coalescer
+
+    @property
+    def shard(self) -> Tuple[int, int]:
+        """Return the validated ``(shard_index, shard_count)`` of this process."""
+        if getattr(self, "_shard", None) is None:
+            shard_index = self.config.get("shard_index")
+            shard_count = self.config.get("shard_count")
+            if shard_index is None:
+                shard_index = 0
+            if shard_count is None:
+                shard_count = 1
+            if shard_count < 1:
+                raise ValueError(
+                    f"shard_count must be at least 1, got {shard_count}."
+                )
+            if not 0 <= shard_index < shard_count:
+                raise ValueError(
+                    f"shard_index must be between 0 and {shard_count - 1}, "
+                    f"got {shard_index}."
+                )
+            self._shard = (shard_index, shard_count)
+        return self._shard
+
+    @property
+    def stop_event(self) -> threading.Event:
+        """Return the event set when a signal asks the poll loop to stop."""
+        if getattr(self, "_stop_event", None) is None:
+            self._stop_event = threading.Event()
+        return self._stop_event
+
     def discover_streams(self) -> List[Stream]:
         """Return a list of discovered streams."""
         return [stream_class(tap=self) for stream_class in STREAM_TYPES]
+
+    def sync_all(self) -> None:
+        """Sync all streams once, or keep polling if ``poll_interval`` is set."""
+        poll_interval = self.config.get("poll_interval")
+        if not poll_interval:
+            self._sync_all_once()
+            return
+
+        stop = self.stop_event
+
+        def _request_stop(signum, frame):
+            LOGGER.info("Received signal %s, stopping the current poll", signum)
+            stop.set()
+
+        previous_handlers = {
+            signum: signal.signal(signum, _request_stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            while not stop.is_set():
+                self.request_coalescer.clear()
+                self._sync_all_once()
+                if not stop.is_set():
+                    LOGGER.info("Next poll in %s seconds", poll_interval)
+                    stop.wait(poll_interval)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        # Streams skipped or cut short by the stop keep their incoming state.
+        for stream in self.streams.values():
+            if stream.selected:
+                stream._write_state_message(force=True)
+
+    def _sync_all_once(self) -> None:
+        """Sync all streams and report their profiles if profiling is enabled."""
+        try:
+            super().sync_all()
+        finally:
+            for stream in self.streams.values():
+                if getattr(stream, "profiler", None) is not None:
+                    stream.profiler.log_summary()
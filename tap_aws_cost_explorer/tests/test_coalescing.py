@@ -0,0 +1,180 @@
+"""Tests the single-flight request coalescer."""
+
+import threading
+
+from tap_aws_cost_explorer.coalescing import RequestCoalescer
+
+REQUEST = {
+    "TimePeriod": {"Start": "2021-01-01", "End": "2021-02-01"},
+    "Granularity": "DAILY",
+    "Metrics": ["UnblendedCost"],
+}
+
+
+class BlockingFetch:
+    """A fetch that counts its calls and blocks until released."""
+
+    def __init__(self, result=None, error=None):
+        self.result = [{"Total": {}}] if result is None else result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _get_in_thread(coalescer, request, fetch, outcomes):
+    def _get():
+        try:
+            outcomes.append(coalescer.get(request, fetch))
+        except Exception as exc:
+            outcomes.append(exc)
+
+    thread = threading.Thread(target=_get)
+    thread.start()
+    return thread
+
+
+def test_identical_requests_share_one_fetch():
+    coalescer = RequestCoalescer()
+    fetch = BlockingFetch()
+    outcomes = []
+
+    owner = _get_in_thread(coalescer, REQUEST, fetch, outcomes)
+    fetch.started.wait(5)
+    reordered = dict(reversed(list(REQUEST.items())))
+    waiters = [
+        _get_in_thread(coalescer, reordered, fetch, outcomes) for _ in range(3)
+    ]
+    fetch.release.set()
+    for thread in [owner, *waiters]:
+        thread.join(5)
+
+    assert fetch.calls == 1
+    assert len(outcomes) == 4
+    assert all(outcome is fetch.result for outcome in outcomes)
+    assert coalescer.get(REQUEST, fetch) is fetch.result
+    assert fetch.calls == 1
+
+
+def test_fetch_error_reaches_waiters_and_is_not_cached():
+    coalescer = RequestCoalescer()
+    fetch = BlockingFetch(error=RuntimeError("throttled"))
+    outcomes = []
+
+    owner = _get_in_thread(coalescer, REQUEST, fetch, outcomes)
+    fetch.started.wait(5)
+    waiter = _get_in_thread(coalescer, REQUEST, fetch, outcomes)
+    fetch.release.set()
+    owner.join(5)
+    waiter.join(5)
+
+    assert [type(outcome) for outcome in outcomes] == [RuntimeError] * 2
+
+    retry = BlockingFetch()
+    retry.release.set()
+    assert coalescer.get(REQUEST, retry) is retry.result
+    assert retry.calls == 1
+
+
+def test_least_recently_used_results_are_evicted_past_the_budget():
+    result = [{"Amount": "x" * 100}]
+    coalescer = RequestCoalescer(max_bytes=250)
+    fetches = {}
+
+    def get(name):
+        fetch = fetches.setdefault(name, BlockingFetch(result=result))
+        fetch.release.set()
+        return coalescer.get({"Name": name}, fetch)
+
+    get("a")
+    get("b")
+    get("a")
+    get("c")
+
+    get("a")
+    get("b")
+    assert fetches["a"].calls == 1
+    assert fetches["b"].calls == 2
+
+
+def test_results_over_the_budget_are_not_retained():
+    coalescer = RequestCoalescer(max_bytes=10)
+    fetch = BlockingFetch(result=[{"Amount": "x" * 100}])
+    fetch.release.set()
+
+    coalescer.get(REQUEST, fetch)
+    coalescer.get(REQUEST, fetch)
+
+    assert fetch.calls == 2
+
+
+def test_clear_keeps_in_flight_requests():
+    coalescer = RequestCoalescer()
+    done = BlockingFetch()
+    done.release.set()
+    coalescer.get({"Name": "done"}, done)
+
+    in_flight = BlockingFetch()
+    outcomes = []
+    owner = _get_in_thread(coalescer, REQUEST, in_flight, outcomes)
+    in_flight.started.wait(5)
+
+    coalescer.clear()
+    waiter = _get_in_thread(coalescer, REQUEST, in_flight, outcomes)
+    in_flight.release.set()
+    owner.join(5)
+    waiter.join(5)
+
+    assert in_flight.calls == 1
+    assert outcomes == [in_flight.result, in_flight.result]
+    coalescer.get({"Name": "done"}, done)
+    assert done.calls == 2
+
+
+def test_oversized_result_does_not_evict_other_results():
+    coalescer = RequestCoalescer(max_bytes=1000)
+    small = BlockingFetch(result=[{"Total": {}}])
+    small.release.set()
+    group = {"Keys": ["Amazon S3"], "Metrics": {"UnblendedCost": {}}}
+    large = BlockingFetch(result=[{"Groups": [group] * 100}])
+    large.release.set()
+
+    coalescer.get({"Name": "a"}, small)
+    coalescer.get({"Name": "b"}, small)
+    coalescer.get({"Name": "large"}, large)
+    coalescer.get({"Name": "a"}, small)
+    coalescer.get({"Name": "b"}, small)
+
+    assert small.calls == 2
+    coalescer.get({"Name": "large"}, large)
+    assert large.calls == 2
+
+
+def test_eviction_follows_completion_order():
+    result = [{"Total": {}}]
+    coalescer = RequestCoalescer(max_bytes=350)
+    slow = BlockingFetch(result=result)
+    outcomes = []
+    owner = _get_in_thread(coalescer, {"Name": "slow"}, slow, outcomes)
+    slow.started.wait(5)
+
+    fast = BlockingFetch(result=result)
+    fast.release.set()
+    coalescer.get({"Name": "a"}, fast)
+    coalescer.get({"Name": "b"}, fast)
+    slow.release.set()
+    owner.join(5)
+    coalescer.get({"Name": "c"}, fast)
+
+    coalescer.get({"Name": "slow"}, slow)
+    assert slow.calls == 1
+    coalescer.get({"Name": "a"}, fast)
+    assert fast.calls == 4
@@ -0,0 +1,36 @@
+"""Tests the per-stream profiler."""
+
+import tracemalloc
+
+from tap_aws_cost_explorer.profiling import StreamProfiler
+
+
+def _allocate_and_free():
+    rows = [{"amount": str(i)} for i in range(50000)]
+    # Give the sampler time to see the peak before the rows are freed.
+    sum(i * i for i in range(100000))
+    del rows
+
+
+def test_allocation_sites_come_from_the_peak(tmp_path):
+    with StreamProfiler("cost", str(tmp_path)) as profiler:
+        _allocate_and_free()
+
+    sites = [
+        statistic.traceback[0].filename for statistic in profiler.allocation_sites
+    ]
+    assert sites[0] == __file__
+    assert profiler.peak_memory > 2 * 1024 * 1024
+    assert (tmp_path / "cost.pstats").exists()
+    assert (tmp_path / "cost.folded").read_text()
+    assert not tracemalloc.is_tracing()
+
+
+def test_keeps_tracing_started_outside_the_profiler(tmp_path):
+    tracemalloc.start()
+    try:
+        with StreamProfiler("cost", str(tmp_path)):
+            _allocate_and_free()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,108 @@
+"""Tests the deterministic work sharding and shard state merging."""
+
+import pytest
+
+from tap_aws_cost_explorer.shards import (
+    get_work_unit,
+    is_assigned,
+    merge_shard_states,
+    split_by_month,
+)
+
+REQUEST = {
+    "TimePeriod": {"Start": "2020-11-17", "End": "2022-02-03"},
+    "Granularity": "DAILY",
+    "Metrics": ["UnblendedCost"],
+    "Filter": {"Dimensions": {"Key": "RECORD_TYPE", "Values": ["Usage"]}},
+}
+
+
+def test_split_by_month_clips_first_and_last_month():
+    assert split_by_month("2021-01-15", "2021-03-10") == [
+        ("2021-01-15", "2021-02-01"),
+        ("2021-02-01", "2021-03-01"),
+        ("2021-03-01", "2021-03-10"),
+    ]
+
+
+def test_split_by_month_rolls_over_the_year():
+    assert split_by_month("2021-12-15", "2022-01-20") == [
+        ("2021-12-15", "2022-01-01"),
+        ("2022-01-01", "2022-01-20"),
+    ]
+    assert split_by_month("2021-12-15", "2022-01-01") == [
+        ("2021-12-15", "2022-01-01"),
+    ]
+
+
+def test_split_by_month_keeps_hourly_timestamps():
+    assert split_by_month("2021-01-15T06:00:00Z", "2021-02-02T00:00:00Z") == [
+        ("2021-01-15T06:00:00Z", "2021-02-01T00:00:00Z"),
+        ("2021-02-01T00:00:00Z", "2021-02-02T00:00:00Z"),
+    ]
+
+
+@pytest.mark.parametrize("shard_count", range(1, 8))
+def test_every_unit_belongs_to_exactly_one_shard(shard_count):
+    windows = split_by_month(
+        REQUEST["TimePeriod"]["Start"], REQUEST["TimePeriod"]["End"]
+    )
+
+    for start, _ in windows:
+        work_unit = get_work_unit(REQUEST, start)
+        owners = [
+            shard_index for shard_index in range(shard_count)
+            if is_assigned(work_unit, shard_index, shard_count)
+        ]
+        assert len(owners) == 1
+
+
+def test_work_unit_does_not_depend_on_the_window_start():
+    later_start = {**REQUEST, "TimePeriod": {"Start": "2021-01-09", "End": "x"}}
+
+    assert get_work_unit(REQUEST, "2021-01-01") == get_work_unit(
+        later_start, "2021-01-09"
+    )
+
+
+def _state(shard_index, shard_count, **bookmarks):
+    return {
+        "bookmarks": {
+            stream: {"last_value": value} for stream, value in bookmarks.items()
+        },
+        "shard": {"index": shard_index, "count": shard_count},
+    }
+
+
+def test_merge_keeps_the_earliest_bookmark():
+    merged = merge_shard_states([
+        _state(1, 2, cost="2021-02-01", costs_by_services="2021-01-01"),
+        _state(0, 2, cost="2021-01-15", costs_by_services="2021-03-01"),
+    ])
+
+    assert merged == {
+        "bookmarks": {
+            "cost": {"last_value": "2021-01-15"},
+            "costs_by_services": {"last_value": "2021-01-01"},
+        }
+    }
+
+
+@pytest.mark.parametrize(
+    "states",
+    [
+        [_state(0, 3), _state(2, 3)],
+        [_state(0, 2), _state(0, 2)],
+        [_state(0, 2), _state(1, 3)],
+        [_state(0, 2, cost="2021-02-01"), _state(1, 2)],
+        [{"bookmarks": {}}],
+        [],
+    ],
+    ids=[
+        "missing", "duplicate", "mismatched-count", "missing-stream",
+        "unsharded", "empty",
+    ],
+)
+def test_merge_rejects_incomplete_runs(states):
+    with pytest.raises(ValueError):
+        merge_shard_states(states)
@@ -0,0 +1,202 @@
+"""Tests the record building helpers shared by every stream."""
+
+import threading
+
+import pytest
+
+from tap_aws_cost_explorer import client
+from tap_aws_cost_explorer.coalescing import RequestCoalescer
+from tap_aws_cost_explorer.streams import CostsByServicesStream
+
+METRICS = ["UnblendedCost", "NetAmortizedCost", "UsageQuantity"]
+
+
+@pytest.fixture
+def make_stream(monkeypatch):
+    """Return a factory of streams built without a tap, for a given config."""
+
+    def _make_stream(stream_class=CostsByServicesStream, **config):
+        monkeypatch.setattr(stream_class, "config", {"metrics": METRICS, **config})
+        stream = stream_class.__new__(stream_class)
+        stream._poll_start = None
+        stream._next_poll_start = None
+        stream._emitted = {}
+        stream._records_changed = False
+        stream._synced = False
+        stream._interrupted = False
+        stream.profiler = None
+        stream.shard_index = 0
+        stream.shard_count = 1
+        stream.coalescer = RequestCoalescer()
+        stream.stop_event = threading.Event()
+        return stream
+
+    return _make_stream
+
+
+def test_wide_schema_has_one_column_pair_per_metric(make_stream):
+    stream = make_stream(wide_records=True)
+
+    properties = stream._get_wide_schema()["properties"]
+
+    for column in ("unblended_cost", "net_amortized_cost", "usage_quantity"):
+        assert f"{column}_amount" in properties
+        assert f"{column}_amount_unit" in properties
+    for column in ("metric_name", "amount", "amount_unit"):
+        assert column not in properties
+
+
+def test_wide_primary_keys_include_group_columns(make_stream):
+    stream = make_stream(wide_records=True, tag_keys=["team"])
+
+    assert stream._get_wide_primary_keys() == [
+        "time_period_start", "service", "charge_type", "tag_key", "tag_value"
+    ]
+    assert "tag_key" in stream._get_wide_schema()["properties"]
+
+
+def test_build_records_wide(make_stream):
+    stream = make_stream(wide_records=True)
+    metrics = {
+        metric: {"Amount": str(i), "Unit": "USD"}
+        for i, metric in enumerate(METRICS)
+    }
+
+    records = stream._build_records({"service": "Amazon S3"}, metrics)
+
+    assert records == [{
+        "service": "Amazon S3",
+        "unblended_cost_amount": "0",
+        "unblended_cost_amount_unit": "USD",
+        "net_amortized_cost_amount": "1",
+        "net_amortized_cost_amount_unit": "USD",
+        "usage_quantity_amount": "2",
+        "usage_quantity_amount_unit": "USD",
+    }]
+
+
+def test_build_records_long(make_stream):
+    stream = make_stream()
+    metrics = {metric: {"Amount": "1", "Unit": "USD"} for metric in METRICS}
+
+    records = stream._build_records({"service": "Amazon S3"}, metrics)
+
+    assert [record["metric_name"] for record in records] == METRICS
+
+
+def _period(start, end, estimated):
+    return {"TimePeriod": {"Start": start, "End": end}, "Estimated": estimated}
+
+
+def test_poll_restarts_at_first_estimated_period(make_stream):
+    stream = make_stream(poll_interval=60)
+
+    stream._track_poll_start([
+        _period("2021-01-01", "2021-01-02", False),
+        _period("2021-01-02", "2021-01-03", True),
+        _period("2021-01-03", "2021-01-04", True),
+    ])
+    stream._track_poll_start([_period("2021-01-01", "2021-01-02", True)])
+
+    assert stream._next_poll_start == "2021-01-01"
+
+
+def test_poll_restarts_at_end_when_all_periods_are_final(make_stream):
+    stream = make_stream(poll_interval=60)
+
+    stream._track_poll_start([
+        _period("2021-01-01", "2021-01-02", False),
+        _period("2021-01-02", "2021-01-03", False),
+    ])
+
+    assert stream._next_poll_start == "2021-01-03"
+
+
+def test_poll_start_is_unchanged_without_results(make_stream):
+    stream = make_stream(poll_interval=60)
+
+    stream._track_poll_start([])
+
+    assert stream._next_poll_start is None
+
+
+def test_unchanged_records_are_not_emitted_again(make_stream):
+    stream = make_stream(poll_interval=60)
+    group = {"time_period_start": "2021-01-01", "service": "Amazon S3"}
+    metrics = {"UnblendedCost": {"Amount": "1", "Unit": "USD"}}
+
+    assert len(stream._build_records(group, metrics)) == 1
+    stream._records_changed = False
+    assert stream._build_records(group, metrics) == []
+    assert not stream._records_changed
+
+    metrics["UnblendedCost"]["Amount"] = "2"
+    assert len(stream._build_records(group, metrics)) == 1
+    assert stream._records_changed
+
+
+def test_final_periods_are_forgotten(make_stream):
+    stream = make_stream(poll_interval=60)
+    metrics = {"UnblendedCost": {"Amount": "1", "Unit": "USD"}}
+    stream._build_records({"time_period_start": "2021-01-01"}, metrics)
+    stream._build_records({"time_period_start": "2021-01-02"}, metrics)
+
+    stream._poll_start = "2021-01-02"
+    stream._prune_emitted()
+
+    assert [dict(identity)["time_period_start"] for identity in stream._emitted] == [
+        "2021-01-02"
+    ]
+
+
+@pytest.fixture
+def written_states(monkeypatch):
+    """Collect the states the streams write instead of printing them."""
+    states = []
+    monkeypatch.setattr(client.singer, "write_state", states.append)
+    monkeypatch.setattr(
+        CostsByServicesStream, "tap_stream_id", "costs_by_services"
+    )
+    return states
+
+
+INCOMING_STATE = {"bookmarks": {"costs_by_services": {"last_value": "2021-01-01"}}}
+
+
+def test_stopped_stream_keeps_its_incoming_state(make_stream, written_states):
+    stream = make_stream(poll_interval=60)
+    stream.state = {"bookmarks": dict(INCOMING_STATE["bookmarks"])}
+    stream.stop_event.set()
+
+    stream.sync()
+    stream._write_state_message(force=True)
+
+    assert written_states == []
+    assert stream.state == INCOMING_STATE
+
+
+def test_interrupted_requests_keep_the_incoming_state(make_stream, written_states):
+    stream = make_stream()
+    stream.state = {"bookmarks": dict(INCOMING_STATE["bookmarks"])}
+    stream.stop_event.set()
+
+    results = stream._get_cost_and_usage(
+        TimePeriod={"Start": "2021-01-01", "End": "2021-02-01"}
+    )
+    stream._write_state_message()
+
+    assert results == []
+    assert stream._interrupted
+    assert written_states == []
+    assert stream.state == INCOMING_STATE
+
+
+def test_synced_stream_is_flushed(make_stream, written_states):
+    stream = make_stream(poll_interval=60)
+    stream.state = {"bookmarks": dict(INCOMING_STATE["bookmarks"])}
+    stream._synced = True
+
+    stream._write_state_message(force=True)
+
+    assert len(written_states) == 1
+    assert stream.state != INCOMING_STATE